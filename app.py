@@ -3,7 +3,6 @@
 # See `ReadMe.md` for details
 
 import numpy as np  # np mean, np random
-import pandas as pd  # read csv, df manipulation
 import plotly.express as px  # interactive charts
 import streamlit as st  # 🎈 data web app development
 import common_functions as utils
@@ -32,19 +31,91 @@ def fn_SetRng():
 rng = fn_SetRng()
 
 # load defaults
-@st.cache_data
+@st.cache_resource
 def fn_GetDefaultParams(parameter_filename: str = 'config.yml') -> dict:
     return utils.fn_LoadFile(parameter_filename)
 
 params_d = fn_GetDefaultParams()
 
+# unpack the scalar parameters used on every rerun, to save repeated dict lookups
+MIN_STAFF_NUM = params_d['MinStaffNum']
+MAX_STAFF_NUM = params_d['MaxStaffNum']
+DEFAULT_STAFF_NUM = params_d['DefaultStaffNum']
+DEFAULT_MAX_STAFF_DISTANCE = params_d['DefaultMaxStaffDistance']
+MAX_VISITS_PER_MONTH = params_d['MaxVisitsPerMonth']
+MIN_HOURS_PER_WEEK = params_d['MinHoursPerWeek']
+MAX_HOURS_PER_WEEK = params_d['MaxHoursPerWeek']
+MAX_WORK_DAYS_PER_WEEK = params_d['MaxWorkDaysPerWeek']
+MAX_WORK_DAYS_PER_MONTH = params_d['MaxWorkDaysPerMonth']
+MAX_WORK_DAYS_PER_YEAR = params_d['MaxWorkDaysPerYear']
+CAR_PETROL_CONV_FACTOR = params_d['CarPetrolConvFactor']
+CAR_DIESEL_CONV_FACTOR = params_d['CarDieselConvFactor']
+BUS_CONV_FACTOR = params_d['BusConvFactor']
+TRAIN_CONV_FACTOR = params_d['TrainConvFactor']
+ELECTRIC_CONV_FACTOR = params_d['ElectricConvFactor']
+LIGHT_ALLOWANCE = params_d['LightAllowance']
+HEAT_ALLOWANCE = params_d['HeatAllowance']
+HEAT_CONV_FACTOR = params_d['HeatConvFactor']
+IT_MOBILE_PHONE = params_d['ItOptions']['mobile phone']
+IT_LAPTOP = params_d['ItOptions']['laptop']
+IT_DESKTOP = params_d['ItOptions']['desktop + monitor']
+
+# car fuel regions and their petrol (vs diesel) ratios, looked up once rather than on every rerun
+CAR_FUEL_OPTIONS = ['United Kingdom', 'England', 'South East', 'North East', 'North West', 'Northern Ireland', 'Scotland', 'South West', 'Wales']
+PETROL_RATIO = {r: params_d[f'{r}_PetrolRatio'] for r in CAR_FUEL_OPTIONS}
+
 # get readme text for the bottom of the page
-@st.cache_data
+@st.cache_resource
 def fn_GetReadMeText(readme_filename: str = 'README.md') -> str:
     return utils.fn_LoadFile(readme_filename)
 
 readme_text = fn_GetReadMeText()
 
+# columns of the downloadable log
+LOG_COLUMNS = 'TotalFte TotalDistance TotalEmissionsCommute TotalEmissionsWfh TotalEmissions'.split()
+LOG_CSV_HEADER = (',' + ','.join(LOG_COLUMNS) + '\n').encode("utf-8")
+LOG_CSV_ROW_FORMAT = '%d,%.4f,%.0f,%.2f,%.2f,%.2f\n' # index, then LOG_COLUMNS
+
+def fn_FormatLogRows(log_rows: np.ndarray, start_ix: int = 0) -> bytes:
+    """
+    Format rows of `sessionLog` as CSV lines for the download log.
+
+    Parameters
+    log_rows: 2D array of log rows, columns as per `LOG_COLUMNS`
+    start_ix: index of the first row in the full log, written as the first CSV column
+
+    Returns
+    utf-8 encoded CSV lines, without the header
+    """
+    # the log is all numeric, so rather than going via a DataFrame, flatten the rows with their
+    # index and format them all with one repeated format string
+    log_ix = np.arange(start_ix, start_ix + len(log_rows))
+    log_values = np.column_stack([log_ix, log_rows]).ravel().tolist()
+    return ((LOG_CSV_ROW_FORMAT * len(log_rows)) % tuple(log_values)).encode("utf-8")
+
+def fn_PercentBarChart(values: np.ndarray, bar_x: np.ndarray = None) -> Any:
+    """
+    Bar chart of the percentage of `values` at each distinct value, or in each of the bins `bar_x`. The groups
+    only hold a few distinct values, so they're binned here and only the bars are sent to the browser rather
+    than every point.
+
+    Parameters
+    values: 1D array of values to chart, e.g. staff hours or distances
+    bar_x: optional sorted 1D array of bin lower limits; each value is counted in the highest bin at or below it
+        so off-grid values (e.g. a median fill) don't add a stray bar that shrinks the others' width
+
+    Returns
+    plotly figure
+    """
+    if bar_x is None:
+        bar_x, bar_counts = np.unique(values, return_counts=True)
+    else:
+        bar_counts = np.bincount(np.searchsorted(bar_x, values, side='right') - 1, minlength=bar_x.size)
+    fig = px.bar(x=bar_x, y=bar_counts * 100 / bar_counts.sum())
+    # keep the same uirevision across reruns so the browser keeps zoom state rather than a full re-layout
+    fig.update_layout(yaxis_title='percent', uirevision='static')
+    return fig
+
 #  set up button click callback
 def fn_Refresher(placeholder_obj: Any, commit_obj: list = None):
     """
@@ -62,27 +133,40 @@ def fn_Refresher(placeholder_obj: Any, commit_obj: list = None):
                 st.session_state[sessionObj[0]] = sessionObj[1]
 
     with placeholder_obj.container(border=True):
-        st.session_state['sessionEmissionsTotal'] = st.session_state['sessionEmissionsTransport'] + st.session_state['sessionEmissionsWfh']
-        st.session_state['sessionLog'].append(
-            [
-                st.session_state.sessionFteTotal, 
-                st.session_state.sessionDistanceTotal, 
-                st.session_state.sessionEmissionsTransport, 
-                st.session_state.sessionEmissionsWfh, 
-                st.session_state.sessionEmissionsTotal, 
-                ]
-                )
-        
-        st.metric('Total FTE', st.session_state.sessionFteTotal, None)
-        st.metric('Total distance (km)', f'{st.session_state.sessionDistanceTotal:.0f}', None)
-        st.metric('Commute Emissions (tn CO2-e)', f'{st.session_state.sessionEmissionsTransport/1000:.1f}', None)
-        st.metric('WFH Emissions (tn CO2-e)', f'{st.session_state.sessionEmissionsWfh/1000:.1f}', None)
-        st.metric('Total Emissions (tn CO2-e)', f'{st.session_state.sessionEmissionsTotal/1000:.1f}', None)
-
-        download_obj = pd.DataFrame(
-            data=st.session_state.sessionLog[1:], 
-            columns=st.session_state.sessionLog[0]
-            ).to_csv().encode("utf-8")
+        # read session values once
+        ss = st.session_state
+        fteTotal = ss.sessionFteTotal
+        distanceTotal = ss.sessionDistanceTotal
+        emissionsTransport = ss.sessionEmissionsTransport
+        emissionsWfh = ss.sessionEmissionsWfh
+        emissionsTotal = emissionsTransport + emissionsWfh
+        ss['sessionEmissionsTotal'] = emissionsTotal
+        logRows = ss.sessionLogRows
+        if logRows == ss.sessionLog.shape[0]:
+            # log is full, so double its size
+            ss['sessionLog'] = np.concatenate([ss.sessionLog, np.zeros_like(ss.sessionLog)])
+        ss.sessionLog[logRows] = [
+            fteTotal,
+            distanceTotal,
+            emissionsTransport,
+            emissionsWfh,
+            emissionsTotal,
+            ]
+        logRows += 1
+        ss['sessionLogRows'] = logRows
+
+        st.metric('Total FTE', fteTotal, None)
+        st.metric('Total distance (km)', f'{distanceTotal:.0f}', None)
+        st.metric('Commute Emissions (tn CO2-e)', f'{emissionsTransport/1000:.1f}', None)
+        st.metric('WFH Emissions (tn CO2-e)', f'{emissionsWfh/1000:.1f}', None)
+        st.metric('Total Emissions (tn CO2-e)', f'{emissionsTotal/1000:.1f}', None)
+
+        # only format the rows added since the download was last built
+        csvRows = ss.sessionLogCsvRows
+        if csvRows < logRows:
+            ss['sessionLogCsv'] = ss.sessionLogCsv + fn_FormatLogRows(ss.sessionLog[csvRows:logRows], csvRows)
+            ss['sessionLogCsvRows'] = logRows
+        download_obj = ss.sessionLogCsv
 
         st.download_button('Download log', download_obj, file_name=f'Indirect Emissions Log {DATE_TODAY}.csv', mime="text/csv")
         # end 
@@ -100,7 +184,7 @@ def fn_FormStaff():
     st.header('Staffing options')
     # user-defined parameters
     cols11 = st.columns(2, vertical_alignment='center')
-    total_staff_num = cols11[0].slider('Staff number', params_d['MinStaffNum'], params_d['MaxStaffNum'], params_d['DefaultStaffNum'])
+    total_staff_num = cols11[0].slider('Staff number', MIN_STAFF_NUM, MAX_STAFF_NUM, DEFAULT_STAFF_NUM)
     part_time_pct = cols11[0].slider('% of part-time workers', 0, 99, 25) / 100
     fteHoursPerWeek = cols11[0].slider('Full time hours/week', 30, 48, 35)
     daysHolidayPerYear = cols11[0].slider('Number of holiday days/yr excl public holidays', 20, 50, 25)
@@ -108,13 +192,13 @@ def fn_FormStaff():
 
     # calculated parameters
     singleFtePerYear = (
-        fteHoursPerWeek / params_d['MaxWorkDaysPerWeek']
+        fteHoursPerWeek / MAX_WORK_DAYS_PER_WEEK
         ) * (
-            params_d['MaxWorkDaysPerYear'] - daysHolidayPerYear - absenceDaysPerYear
+            MAX_WORK_DAYS_PER_YEAR - daysHolidayPerYear - absenceDaysPerYear
             )
     
     part_time_median = int(fteHoursPerWeek * 0.5)
-    part_time_num = int(np.floor(total_staff_num * part_time_pct))
+    part_time_num = int(total_staff_num * part_time_pct)
     full_time_num = total_staff_num - part_time_num
     # poisson is always positive but may exceed the working hours, so clip
     # part_time_group_r = rng.poisson(part_time_median, size=part_time_num *2) # oversample to make sure the group is big enough
@@ -122,23 +206,18 @@ def fn_FormStaff():
     # part_time_group = list(rng.choice(part_time_group_r, size=part_time_num, replace=False))
 
     # remove stochastic part to simplify
-    part_time_group_lims = np.linspace(params_d['MinHoursPerWeek'], fteHoursPerWeek, num=5, endpoint=False)
-    part_time_group = []
-    for ix, ix2 in enumerate([0.1, 0.2, 0.4, 0.2]):
-        part_time_group += [part_time_group_lims[ix] for y in range(int(part_time_num * ix2))]
-
-    part_time_group += [part_time_group_lims[4] for y in range(part_time_num - len(part_time_group))]
-    total_staff_group = [fteHoursPerWeek for i in range(full_time_num)] + part_time_group
+    part_time_group_lims = np.linspace(MIN_HOURS_PER_WEEK, fteHoursPerWeek, num=5, endpoint=False)
+    total_staff_group = utils.fn_StaffGroup(full_time_num, fteHoursPerWeek, part_time_num, part_time_group_lims)
 
-    newFteTotal = np.round(sum(total_staff_group) / params_d['MaxHoursPerWeek'], 2) # sessionFteTotal
+    newFteTotal = np.round(total_staff_group.sum() / MAX_HOURS_PER_WEEK, 2) # sessionFteTotal
     newStaffTotal = total_staff_num # sessionStaffTotal
-    newAbsenceRate = singleFtePerYear / ((fteHoursPerWeek / params_d['MaxWorkDaysPerWeek']) * params_d['MaxWorkDaysPerYear']) # sessionStaffAbsenceRate
+    newAbsenceRate = singleFtePerYear / ((fteHoursPerWeek / MAX_WORK_DAYS_PER_WEEK) * MAX_WORK_DAYS_PER_YEAR) # sessionStaffAbsenceRate
     newTtlHrsPerYr = singleFtePerYear * newFteTotal # sessionStaffTotalHoursPerYear
 
     # display a graph of staffing and total FTE
     # then create a DF when it's committed
     # then save to session state
-    fig = px.histogram(x=total_staff_group, histnorm='percent')
+    fig = fn_PercentBarChart(total_staff_group)
     fig.update_layout(yaxis_range=[0,100], xaxis_title="Hours per week")
     cols11[1].plotly_chart(fig, theme="streamlit")
 
@@ -165,15 +244,16 @@ def fn_FormCommute():
     """
     st.header('Commuting options')
     cols40 = st.columns(2, vertical_alignment='top')
-    sliderDistance = cols40[0].slider('Staff travel distance range (km)', 1, 1000, (1, params_d['DefaultMaxStaffDistance']), key='sliderDistance')
-    sliderOfficeVisits = cols40[0].slider('Office visits per month', 1, params_d['MaxVisitsPerMonth'], 4, key='sliderOfficeVisits')
+    sliderDistance = cols40[0].slider('Staff travel distance range (km)', 1, 1000, (1, DEFAULT_MAX_STAFF_DISTANCE), key='sliderDistance')
+    sliderOfficeVisits = cols40[0].slider('Office visits per month', 1, MAX_VISITS_PER_MONTH, 4, key='sliderOfficeVisits')
     
     radioCloseFar_d = {'Very close':'VeryCloseList', 'Close':'CloseList', 'Far':'FarList', 'Medium': 'MediumList'}
     radioCloseFar = cols40[0].radio('Closeness to the office', options=[k for k in radioCloseFar_d.keys()], index=0, key='radioCloseFar')
     
     # calculated params
-    distanceRange = max(sliderDistance) - min(sliderDistance)
-    maxCommuteDistance = max(sliderDistance) * 4 
+    distanceMin, distanceMax = sliderDistance # range sliders return (low, high)
+    distanceRange = distanceMax - distanceMin
+    maxCommuteDistance = distanceMax * 4 
 
     # remove stochastic part to simplify
     # distanceMedian = min(sliderDistance) + (distanceRange * radioCloseFar_d[radioCloseFar])
@@ -182,23 +262,20 @@ def fn_FormCommute():
     # distance_group = list(rng.choice(distance_group_r, size=st.session_state.sessionStaffTotal, replace=True))
     
     # set up the distance bins
-    distance_group_lims = np.linspace(min(sliderDistance), max(sliderDistance) , num=20, endpoint=True)
+    distance_group_lims = np.linspace(distanceMin, distanceMax, num=20, endpoint=True)
     # allocate distances
-    distance_group = []
-    for ix, ix2 in enumerate(params_d[radioCloseFar_d[radioCloseFar]][:-1]):
-        distance_group += [distance_group_lims[ix] for y in range(int(st.session_state.sessionStaffTotal * ix2))]
-    # fill up to full staffing size
-    distance_group += [np.median(distance_group_lims) for y in range(st.session_state.sessionStaffTotal - len(distance_group))]
-    # calculate actual commute distances
-    distanceCommuteRaw = [d * 2 * sliderOfficeVisits for d in  distance_group]
-    # apply cap
-    distanceCommute = [d if d < maxCommuteDistance else maxCommuteDistance for d in distanceCommuteRaw ]
-    newOfficeRate = np.round(sliderOfficeVisits / params_d['MaxWorkDaysPerMonth'], 4) # sessionStaffOfficeRate
-    newDistanceTotal = int(sum(distanceCommute)) # sessionDistanceTotal
+    distance_weights = np.array(params_d[radioCloseFar_d[radioCloseFar]][:-1])
+    staffTotal = st.session_state.sessionStaffTotal
+    distance_counts = (staffTotal * distance_weights).astype(int)
+    # start with everyone at the median to fill up to full staffing size, then allocate the bins over the top
+    distance_group = np.full(staffTotal, np.median(distance_group_lims), dtype=np.float64)
+    distance_group[:distance_counts.sum()] = np.repeat(distance_group_lims[:distance_weights.size], distance_counts)
+    newOfficeRate = np.round(sliderOfficeVisits / MAX_WORK_DAYS_PER_MONTH, 4) # sessionStaffOfficeRate
+    newDistanceTotal = int(utils.fn_CommuteTotal(distance_group, sliderOfficeVisits, maxCommuteDistance)) # sessionDistanceTotal
 
     #display
     cols40[0].metric("Total distance", f"{newDistanceTotal} km", None)
-    fig2 = px.histogram(x=distance_group, histnorm='percent')
+    fig2 = fn_PercentBarChart(distance_group, distance_group_lims)
     fig2.update_layout(xaxis_title="Distance from office (km)")
     cols40[1].plotly_chart(fig2, theme="streamlit")
 
@@ -206,35 +283,34 @@ def fn_FormCommute():
     cols31 = st.columns([0.6, 0.4], vertical_alignment='center')
     # walk, car, public transport
     sliderTransMix = cols31[0].slider('Select %age mix between walk/cycle (left), car (middle range), and public transport (right)', 1, 100, (33,67))
+    transMixMin, transMixMax = sliderTransMix
     # bus or train
-    sliderBusTrain = cols31[1].slider('Select %age mix between bus (left) and train (right)', 1, 100-max(sliderTransMix), int((100-max(sliderTransMix))/2))
+    sliderBusTrain = cols31[1].slider('Select %age mix between bus (left) and train (right)', 1, 100-transMixMax, int((100-transMixMax)/2))
 
-    walk_pct = min(sliderTransMix)
-    car_pct = max(sliderTransMix)-min(sliderTransMix)
+    walk_pct = transMixMin
+    car_pct = transMixMax-transMixMin
     bus_pct = sliderBusTrain
-    train_pct = int(100-max(sliderTransMix) - bus_pct)
+    train_pct = int(100-transMixMax - bus_pct)
 
     cols32 = st.columns(5, vertical_alignment='center')
     cols32[0].metric("Walk/cycle", f"{walk_pct}%", None)
     cols32[1].metric("Car", f"{car_pct}%", None)
     cols32[2].metric("Bus", f"{bus_pct}%", None)
     cols32[3].metric("Train", f"{train_pct}%", None)
-    carFuelOptions = ['United Kingdom', 'England', 'South East', 'North East', 'North West', 'Northern Ireland', 'Scotland', 'South West', 'Wales']
-    selectCarRegion = cols32[-1].selectbox('Region for car fuel', options=carFuelOptions, index=0) 
+    selectCarRegion = cols32[-1].selectbox('Region for car fuel', options=CAR_FUEL_OPTIONS, index=0) 
 
     #  assign transport and calculate emissions
-    emissionsCar = st.session_state['sessionDistanceTotal'] * car_pct
-    emissionsCarPetrol = emissionsCar * params_d[f'{selectCarRegion}_PetrolRatio']
+    distanceTotal = st.session_state['sessionDistanceTotal']
+    emissionsCar = distanceTotal * car_pct
+    emissionsCarPetrol = emissionsCar * PETROL_RATIO[selectCarRegion]
     emissionsCarDiesel = emissionsCar - emissionsCarPetrol
     # assign car fuels
-    newEmissionsTransport = sum(
-        [
-            emissionsCarPetrol * params_d['CarPetrolConvFactor'], 
-            emissionsCarDiesel * params_d['CarDieselConvFactor'],
-            st.session_state['sessionDistanceTotal'] * bus_pct * params_d['BusConvFactor'],
-            st.session_state['sessionDistanceTotal'] * train_pct * params_d['TrainConvFactor'],
-            ]
-            ) # sessionEmissionsTransport
+    newEmissionsTransport = (
+        emissionsCarPetrol * CAR_PETROL_CONV_FACTOR
+        + emissionsCarDiesel * CAR_DIESEL_CONV_FACTOR
+        + distanceTotal * bus_pct * BUS_CONV_FACTOR
+        + distanceTotal * train_pct * TRAIN_CONV_FACTOR
+        ) # sessionEmissionsTransport
     
     commit_l = [
         ['sessionStaffOfficeRate', newOfficeRate],
@@ -248,6 +324,111 @@ def fn_FormCommute():
     if cols39[-1].button('Confirm', key='ConfirmCommute'):
         fn_Refresher(sidebar_ph, commit_l)
 
+# WFH IT and lighting emissions, split out of fn_FormWfh so the fragment can reuse the last results
+def fn_CalcWfhItLight(
+        staffTotal: int,
+        wfhHours: float,
+        sliderLaptop: float,
+        sliderPhone: float,
+        optionsMonitor: tuple
+        ) -> tuple:
+    """
+    Calculate the IT and lighting emissions from working from home. Deterministic in its inputs.
+
+    Parameters
+    staffTotal: total number of staff
+    wfhHours: total staff hours per year worked from home
+    sliderLaptop, sliderPhone: fraction of staff with laptops, mobile phones
+    optionsMonitor: selected `ScreenOptions` keys
+
+    Returns
+    (newEmissionsIt, newEmissionsLight)
+    """
+    #  calulated params
+    numLaptop = int(staffTotal * sliderLaptop)
+    numDesktop = int(staffTotal - numLaptop)
+    numPhone = int(staffTotal * sliderPhone)
+
+    #  allocate emissions 
+    phoneGroupRaw = IT_MOBILE_PHONE * numPhone
+    computerGroupRaw = (wfhHours * sliderLaptop * IT_LAPTOP ) + (
+        wfhHours * (1-sliderLaptop) * IT_DESKTOP
+    )
+      
+    # share of WFH hours for each monitor option, set to the mean of the previous
+    # random draw of 1 to int(100/(options+1)) - 1 percent so runs are reproducible
+    monitorShare = int(100 / (len(optionsMonitor) + 1)) / 200
+    monitorGroupRaw = wfhHours * monitorShare * sum(params_d['ScreenOptions'][o] for o in optionsMonitor)
+    # sessionEmissionsIt
+    newEmissionsIt = (computerGroupRaw + phoneGroupRaw + monitorGroupRaw) * ELECTRIC_CONV_FACTOR
+    
+    # lighting
+    # st.session_state.sessionEmissionsLight
+    newEmissionsLight = ELECTRIC_CONV_FACTOR * wfhHours * LIGHT_ALLOWANCE * 0.5 # lighting only on for 6 months of the year
+
+    return newEmissionsIt, newEmissionsLight
+
+# WFH heating emissions, a fresh random draw on every call
+def fn_CalcWfhHeat(
+        staffTotal: int,
+        wfhHours: float,
+        sliderHeatMonths: tuple,
+        sliderHeatHome: tuple,
+        sliderHeatSharing: int
+        ) -> float:
+    """
+    Calculate the heating emissions from working from home. Stochastic, so not cached.
+
+    Parameters
+    staffTotal: total number of staff
+    wfhHours: total staff hours per year worked from home
+    sliderHeatMonths, sliderHeatHome: (min, max) percentage range slider values
+    sliderHeatSharing: percentage sharing heating with others
+
+    Returns
+    newEmissionsHeat
+    """
+    heatMonthsMin, heatMonthsMax = sliderHeatMonths # range sliders return (low, high)
+    heatHomeMin, heatHomeMax = sliderHeatHome
+    # create an overall scalar for our total WFH hours, built on the various options
+    #  first identify those who use heating
+    numNonZeroHeat = int(staffTotal * (1-(heatMonthsMin/100))) # exclude people who don't use heating
+    #  each factor is [scalars, weight of heating users with each scalar]
+    #  scalars for 6 & 12 months of heating respectively (heating allowance is calculated for 6 months)
+    heatMonths = np.array([
+        [1, 2],
+        [
+            heatMonthsMax - heatMonthsMin, # winter heating
+            100 - heatMonthsMax # whole year
+        ]
+        ], dtype=float)
+    # extent of heating
+    heatHome = np.array([
+        [0.25, 0.5, 1],
+        [
+            heatHomeMin, # workspace only
+            heatHomeMax - heatHomeMin, # part of home
+            100 - heatHomeMax # whole home
+        ]
+        ], dtype=float)
+    # sharing
+    heatShare = np.array([
+        [0.5, 1],
+        [
+            sliderHeatSharing, # sharing
+            100 - sliderHeatSharing # no sharing
+        ]
+        ], dtype=float)
+
+    heatSum = utils.fn_HeatScalarSum(rng, numNonZeroHeat, heatMonths, heatHome, heatShare)
+
+    # now normalise our heating group and convert to kWh gas / yr
+    newEmissionsHeat = (
+        heatSum / staffTotal 
+        ) * wfhHours * HEAT_ALLOWANCE * HEAT_CONV_FACTOR # sessionEmissionsHeat
+
+    return newEmissionsHeat
+
 # FORM - WFH OPTIONS
 @st.experimental_fragment
 def fn_FormWfh():
@@ -266,89 +447,25 @@ def fn_FormWfh():
         ['1 extra monitor']
     )
     
-    #  calulated params
-    wfhHours = st.session_state.sessionStaffTotalHoursPerYear * (1 - st.session_state.sessionStaffOfficeRate)
-    numLaptop = int(np.floor(st.session_state.sessionStaffTotal * sliderLaptop))
-    numDesktop = int(st.session_state.sessionStaffTotal - numLaptop)
-    numPhone = int(np.floor(st.session_state.sessionStaffTotal * sliderPhone))
-
-    #  allocate emissions 
-    phoneGroupRaw = params_d['ItOptions']['mobile phone'] * numPhone
-    computerGroupRaw = (wfhHours * sliderLaptop * params_d['ItOptions']['laptop'] ) + (
-        wfhHours * (1-sliderLaptop) * params_d['ItOptions']['desktop + monitor']
-    )
-      
-    monitorGroupRaw = 0
-
-    if len(optionsMonitor) > 0:
-        for this_option in optionsMonitor:
-            opt_ttl = rng.integers(low=1, high=int(100/(len(optionsMonitor) + 1)))
-            monitorGroupRaw += wfhHours * (opt_ttl / 100) * params_d['ScreenOptions'][this_option]
-    # sessionEmissionsIt
-    newEmissionsIt = sum(
-        [
-            computerGroupRaw,
-            phoneGroupRaw, 
-            monitorGroupRaw,
-            ]
-            ) * params_d['ElectricConvFactor']
-    
-    # lighting
-    # st.session_state.sessionEmissionsLight
-    newEmissionsLight = params_d['ElectricConvFactor'] * wfhHours * params_d['LightAllowance'] * 0.5 # lighting only on for 6 months of the year
-
-    # Heating
-    newEmissionsHeat = 0
-    
     cols52 = st.columns(3, vertical_alignment='center')
     sliderHeatMonths = cols52[0].slider('Select no heating (left), winter heating (centre), whole year (right)', 0, 100, (30,80))
     sliderHeatHome = cols52[1].slider('Select workspace only (left), part of home (centre), whole home (right)', 0, 100, (30, 60))
     sliderHeatSharing = cols52[2].slider('% sharing with others', 0, 100, 33)
 
-    # create an overall scalar for our total WFH hours, built on the various options
-    #  first identify those who use heating
-    numNonZeroHeat = int(st.session_state.sessionStaffTotal * (1-(min(sliderHeatMonths)/100))) # exclude people who don't use heating
-    #  set up a list of scalars for 6 & 12 months of heating respectively (heating allowance is calculated for 6 months)
-    heatMonthsRaw = [1 for x in range(max(sliderHeatMonths) - min(sliderHeatMonths))] + [2 for x in range(100-max(sliderHeatMonths))]
-    heatMonthsRaw = rng.choice(heatMonthsRaw, size=numNonZeroHeat, replace=True) # randomise to size of our set
-    # now randomly assign the extent of heating
-    heatHomeRaw = rng.choice(
-        [0.25, 0.5, 1], 
-        size = numNonZeroHeat, 
-        p = [
-            min(sliderHeatHome) / 100, # workspace only
-            (max(sliderHeatHome) - min(sliderHeatHome)) / 100, # part of home
-            (100-max(sliderHeatHome)) / 100 # whole home
-        ]
-        )
-
-    # now randomly assign sharing
-    heatShareRaw = rng.choice(
-            [0.5, 1], 
-            size = numNonZeroHeat, 
-            p = [
-                sliderHeatSharing / 100, # sharing
-                (100-sliderHeatSharing) / 100 # no sharing
-            ]
-            )
-
-    # now multiply all scalars 
-    heatGroup = [
-        i * j * k for i, j, k in zip(heatMonthsRaw, heatHomeRaw, heatShareRaw)
-        ] 
+    #  calulated params
+    staffTotal = st.session_state.sessionStaffTotal
+    wfhHours = st.session_state.sessionStaffTotalHoursPerYear * (1 - st.session_state.sessionStaffOfficeRate)
 
-    # now normalise our heating group and convert to kWh gas / yr
-    newEmissionsHeat = (
-        sum(heatGroup) / st.session_state.sessionStaffTotal 
-        ) * wfhHours * params_d['HeatAllowance'] * params_d['HeatConvFactor'] # sessionEmissionsHeat
+    # the IT and lighting emissions only depend on these, so reuse the last results while none of them change
+    wfhCacheKey = (staffTotal, wfhHours, sliderLaptop, sliderPhone, tuple(optionsMonitor))
+    if st.session_state.get('sessionWfhCacheKey') != wfhCacheKey:
+        st.session_state['sessionWfhCacheKey'] = wfhCacheKey
+        st.session_state['sessionWfhCacheVal'] = fn_CalcWfhItLight(*wfhCacheKey)
+    newEmissionsIt, newEmissionsLight = st.session_state['sessionWfhCacheVal']
+    # heating is the stochastic part of the model, so draw it afresh on every run (see README)
+    newEmissionsHeat = fn_CalcWfhHeat(staffTotal, wfhHours, sliderHeatMonths, sliderHeatHome, sliderHeatSharing)
     
-    newEmissionsWfh = sum(
-        [
-            newEmissionsIt,
-            newEmissionsLight,
-            newEmissionsHeat
-        ], 
-        ) # sessionEmissionsWfh
+    newEmissionsWfh = newEmissionsIt + newEmissionsLight + newEmissionsHeat # sessionEmissionsWfh
     
     commit_l = [
         ['sessionEmissionsLight', newEmissionsLight],
@@ -373,16 +490,21 @@ for k,v in params_d['SessionDefaults'].items():
 
 # calc'd session vars
 if 'sessionLog' not in st.session_state:
-    st.session_state['sessionLog'] = ['TotalFte TotalDistance TotalEmissionsCommute TotalEmissionsWfh TotalEmissions'.split()]
+    # preallocated, fn_Refresher grows it as needed; sessionLogRows is the number of rows in use
+    st.session_state['sessionLog'] = np.zeros((16, len(LOG_COLUMNS)))
+    st.session_state['sessionLogRows'] = 0
+    # download bytes for the first sessionLogCsvRows rows of the log
+    st.session_state['sessionLogCsv'] = LOG_CSV_HEADER
+    st.session_state['sessionLogCsvRows'] = 0
 
 if 'sessionStaffAbsenceRate' not in st.session_state:
-    st.session_state['sessionStaffAbsenceRate'] = (params_d['MaxWorkDaysPerYear'] - params_d['DefaultAbsencePerYear']) / params_d['MaxWorkDaysPerYear']
+    st.session_state['sessionStaffAbsenceRate'] = (MAX_WORK_DAYS_PER_YEAR - params_d['DefaultAbsencePerYear']) / MAX_WORK_DAYS_PER_YEAR
 
 if 'sessionStaffOfficeRate' not in st.session_state:
-    st.session_state['sessionStaffOfficeRate'] = 4 / params_d['MaxWorkDaysPerMonth']
+    st.session_state['sessionStaffOfficeRate'] = 4 / MAX_WORK_DAYS_PER_MONTH
 
 if 'sessionStaffTotalHoursPerYear' not in st.session_state:
-    st.session_state['sessionStaffTotalHoursPerYear'] = params_d['MaxWorkDaysPerYear'] * (1 - st.session_state['sessionStaffAbsenceRate']) * (params_d['MaxHoursPerWeek'] / 5)
+    st.session_state['sessionStaffTotalHoursPerYear'] = MAX_WORK_DAYS_PER_YEAR * (1 - st.session_state['sessionStaffAbsenceRate']) * (MAX_HOURS_PER_WEEK / 5)
 
 # set up sidebar
 with st.sidebar.container(border=True):
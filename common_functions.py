@@ -2,8 +2,13 @@
 # Supporting functions
 
 import streamlit as st
+import numpy as np
 import os
 import yaml
+try:
+    from yaml import CSafeLoader as SafeLoader # LibYAML C loader, much faster where available
+except ImportError:
+    from yaml import SafeLoader
 
 def fn_LoadFile(filename: str) -> dict:
     fn_name = 'common_functions.py fn_LoadFile'
@@ -18,5 +23,71 @@ def fn_LoadFile(filename: str) -> dict:
             load_object = f.read()
     if file_ext == 'yml':
         with open(filename, 'rb') as f: 
-            load_object = yaml.load(f, Loader=yaml.SafeLoader)
+            load_object = yaml.load(f, Loader=SafeLoader)
     return load_object
+
+def fn_StaffGroup(full_time_num: int, fte_hours: float, part_time_num: int, part_time_group_lims: np.ndarray) -> np.ndarray:
+    """
+    Weekly hours for each member of staff.
+
+    Parameters
+    full_time_num: number of full-time staff, each working `fte_hours`
+    fte_hours: full time hours/week
+    part_time_num: number of part-time staff, split 10/20/40/20% over the first four bands with the remainder in the top band
+    part_time_group_lims: hours/week of the five part-time bands
+
+    Returns
+    1D array of hours/week, one per member of staff
+    """
+    # allocate everyone in one array, full-timers first
+    staff_group = np.full(full_time_num + part_time_num, fte_hours, dtype=np.float64)
+    part_time_counts = (part_time_num * np.array([0.1, 0.2, 0.4, 0.2])).astype(int)
+    part_time_group = staff_group[full_time_num:] # view, so writes go into staff_group
+    # remainder goes in the top band
+    part_time_group[:] = part_time_group_lims[4]
+    part_time_group[:part_time_counts.sum()] = np.repeat(part_time_group_lims[:4], part_time_counts)
+    return staff_group
+
+def fn_CommuteTotal(distance_group: np.ndarray, office_visits: int, max_commute_distance: float) -> float:
+    """
+    Total monthly commute distance.
+
+    Parameters
+    distance_group: 1D array of distance from the office, one per member of staff
+    office_visits: office visits per month, each a return trip
+    max_commute_distance: cap on any one person's monthly commute distance
+
+    Returns
+    total distance
+    """
+    # calculate actual commute distances and apply cap in place, so only one temporary array is made
+    distance_commute = distance_group * (2 * office_visits)
+    np.minimum(distance_commute, max_commute_distance, out=distance_commute)
+    return distance_commute.sum()
+
+def fn_HeatScalarSum(rng: np.random.Generator, num_heat: int, heat_months: np.ndarray, heat_home: np.ndarray, heat_share: np.ndarray) -> float:
+    """
+    Randomly assign heating scalars to the staff who use heating and return their sum.
+
+    Parameters
+    rng: random generator
+    num_heat: number of staff using heating
+    heat_months, heat_home, heat_share: 2 row arrays of [scalars, weights] for each heating factor,
+        the weights need not be normalised
+
+    Returns
+    sum of the heating scalars over `num_heat` staff
+    """
+    if num_heat == 0:
+        return 0
+    # normalise the weights into probabilities
+    heat_months, heat_home, heat_share = (h / [[1], [h[1].sum()]] for h in (heat_months, heat_home, heat_share))
+    # only the total matters, so rather than drawing each person's scalars, draw how many
+    # people fall in each months x home x sharing combination and multiply all scalars
+    # broadcast to every combination, giving each combination's scalar and its probability in one pass
+    heat_scalars, heat_scalars_p = (
+        heat_months[:, :, None, None] * heat_home[:, None, :, None] * heat_share[:, None, None, :]
+        ).reshape(2, -1)
+    heat_counts = rng.multinomial(num_heat, heat_scalars_p)
+    # dot product multiplies and accumulates in one pass, without an intermediate array
+    return heat_counts @ heat_scalars